@@ -6,6 +6,7 @@ Import and use these functions in your API endpoints for database operations.
 """
 
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -18,12 +19,27 @@ load_dotenv()
 _client = None
 db = None
 
+# Async (Motor) handle for request-path queries; shares the env config
+_async_client = None
+async_db = None
+
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+# Pool settings: keep warm sockets around and fail fast instead of
+# paying a TCP+TLS handshake (or hanging) per burst of requests
+_POOL_KWARGS = dict(
+    maxPoolSize=50,
+    minPoolSize=10,
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+)
+
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = MongoClient(database_url, **_POOL_KWARGS)
     db = _client[database_name]
+    _async_client = AsyncIOMotorClient(database_url, **_POOL_KWARGS)
+    async_db = _async_client[database_name]
 
 # Helper functions for common database operations
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
@@ -31,9 +47,10 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    # Convert Pydantic model to dict if needed
+    # Convert Pydantic model to dict if needed; mode="json" turns v2
+    # types like HttpUrl into plain strings that BSON can encode
     if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
+        data_dict = data.model_dump(mode="json")
     else:
         data_dict = data.copy()
 
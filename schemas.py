@@ -9,13 +9,17 @@ Example: class Property -> "property" collection
 """
 
 from typing import List, Optional
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
 
 # ------------------------------
 # Core Real Estate Schemas
 # ------------------------------
 
 class Agent(BaseModel):
+    # Nested value objects are frozen: never mutated after validation,
+    # which lets pydantic v2 hash and cache them
+    model_config = ConfigDict(frozen=True)
+
     name: str
     photo: Optional[HttpUrl] = None
     phone: Optional[str] = None
@@ -23,6 +27,8 @@ class Agent(BaseModel):
     license: Optional[str] = None
 
 class Location(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     street: str
     city: str
     state: str
@@ -32,12 +38,16 @@ class Location(BaseModel):
     lng: Optional[float] = Field(None, ge=-180, le=180)
 
 class Media(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     cover_image: Optional[HttpUrl] = None
     gallery: List[HttpUrl] = []
     video_url: Optional[HttpUrl] = None
     virtual_tour_url: Optional[HttpUrl] = None
 
 class Financial(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     hoa_fees: Optional[float] = Field(None, ge=0)
     taxes: Optional[float] = Field(None, ge=0)
 